@@ -1,115 +1,87 @@
 import dash_bootstrap_components as dbc
 import numpy as np
-import pandas as pd
 import plotly.graph_objects as go
 from dash import dcc
 
+# Earth radius in kms
+EARTH_RADIUS = 6371.0  # in kms
 
-def extract_lat_lon(wkt_point):
-    if pd.isnull(wkt_point):
-        return pd.Series([np.nan, np.nan])  # Return NaN if the value is null
-    # Remove 'POINT(' and ')' and split by space
-    wkt_point = wkt_point.replace("POINT (", "").replace(")", "")
-    lon, lat = map(float, wkt_point.split())
-    return pd.Series([lat, lon])
-
-
-# Function to calculate the min and max distances between points (cached)
-def calculate_min_max_distance(distances):
-    min_distance = min(distances.values())
-    max_distance = max(distances.values())
-    return min_distance, max_distance
-
-
-def greedy_weighted_avg_aggregation(df, distances, proximity_threshold):
-    # Create an empty list to store aggregated data
-    aggregated_data = []
-    processed_indices = set()
-
-    valid_indices = set(df.index)
-
-    # Sort the distances and extract sorted row pairs
-    sorted_distances = sorted(distances.items(), key=lambda x: x[1])
-
-    # Flatten the sorted row pairs into a list of valid row indices
-    sorted_row_indices = [
-        index
-        for pair, _ in sorted_distances
-        for index in pair
-        if index in valid_indices
-    ]
-
-    # Loop through all points by sorted row index
-    for i in sorted_row_indices:
-        if i in processed_indices:
-            continue  # Skip already processed points
-
-        # Start with the current point as the center
-        group = [i]
-        processed_indices.add(i)
-
-        # Find all nearby points within the proximity threshold
-        for j in sorted_row_indices:
-            if i != j and j not in processed_indices:
-                # Ensure that the distance is valid and is not None
-                distance = distances.get((i, j))
-                if (
-                    distance is not None
-                    and distance < proximity_threshold
-                    and j in valid_indices
-                ):
-                    group.append(j)
-                    processed_indices.add(j)
-
-        # Validate the group indices exist in the DataFrame
-        group = [idx for idx in group if idx in valid_indices]
-
-        # Proceed only if the group is valid
-        if not group:
-            continue
-
-        # Calculate the weighted average of the grade using tonnage as weights
-        total_tonnage = df.loc[group, "total_tonnage"].sum()
-        weighted_grade = np.average(
-            df.loc[group, "total_grade"], weights=df.loc[group, "total_tonnage"]
-        )
 
-        # Combine ms_name values from the group
-        combined_ms_name = ":: ".join(df.loc[group, "ms_name"])
-
-        # Combine ms_name values from the group
-        if len(df.loc[group, "ms_name"]) > 1:
-            combined_ms_name = ":: " + ":: ".join(df.loc[group, "ms_name"])
-        else:
-            combined_ms_name = ":: ".join(df.loc[group, "ms_name"])
-
-        # Combine ms values from the group
-        if len(df.loc[group, "ms"]) > 1:
-            combined_ms = ":: " + ":: ".join(df.loc[group, "ms"])
-        else:
-            combined_ms = ":: ".join(df.loc[group, "ms"])
-
-        # Retrieve consistent values for other columns
-        ms_value = df.loc[group[0], "ms"]
-        commodity_value = df.loc[group[0], "commodity"]
-        top1_deposit_name_value = df.loc[group[0], "top1_deposit_name"]
-        lat = df.loc[group[0], "lat"]
-        lon = df.loc[group[0], "lon"]
-
-        aggregated_data.append(
-            {
-                "total_grade": weighted_grade,
-                "total_tonnage": total_tonnage,
-                "ms_name": combined_ms_name,
-                "ms": combined_ms,
-                "commodity": commodity_value,
-                "top1_deposit_name": top1_deposit_name_value,
-                "lat": lat,
-                "lon": lon,
-            }
+# Pairwise haversine distances (in kms) between the rows of df as parallel edge
+# arrays of row positions (i < j only)
+def compute_pairwise_distances(df):
+    coords = np.deg2rad(df[["lat", "lon"]].to_numpy(dtype=np.float64))
+    i, j = (index.astype(np.int32) for index in np.triu_indices(len(coords), k=1))
+
+    lat, lon = coords[:, 0], coords[:, 1]
+    cos_lat = np.cos(lat)  # once per point instead of twice per pair
+
+    a = (
+        np.sin((lat[j] - lat[i]) / 2) ** 2
+        + cos_lat[i] * cos_lat[j] * np.sin((lon[j] - lon[i]) / 2) ** 2
+    )
+    distances = (2 * EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).astype(
+        np.float32
+    )
+
+    return i, j, distances
+
+
+# Connected components of the graph made of the edges shorter than threshold,
+# returned as dense cluster ids (0..k-1) for each of the n points
+def cluster_edges(n, pair_i, pair_j, pair_d, threshold):
+    # Only keep the edges under the threshold (NaN distances never are)
+    close = pair_d < threshold
+    pair_i, pair_j = pair_i[close], pair_j[close]
+
+    # Min-label propagation with pointer jumping, vectorized over all edges
+    labels = np.arange(n, dtype=np.int32)
+    while True:
+        lowest = np.minimum(labels[pair_i], labels[pair_j])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, pair_i, lowest)
+        np.minimum.at(new_labels, pair_j, lowest)
+        new_labels = new_labels[new_labels]
+
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    _, cluster_id = np.unique(labels, return_inverse=True)
+    return cluster_id.astype(np.int32)
+
+
+def greedy_weighted_avg_aggregation(df, pair_i, pair_j, pair_d, proximity_threshold):
+    cluster_id = cluster_edges(len(df), pair_i, pair_j, pair_d, proximity_threshold)
+
+    # Weighted average of the grade using tonnage as weights, one pass per column
+    tonnage = df["total_tonnage"].to_numpy(dtype=np.float64)
+    grade = df["total_grade"].to_numpy(dtype=np.float64)
+    total_tonnage = np.bincount(cluster_id, weights=tonnage)
+    weighted_grade = np.bincount(cluster_id, weights=grade * tonnage) / total_tonnage
+
+    # Combine ms_name and ms values and retrieve consistent values for other
+    # columns, all in a single groupby pass
+    aggregated_df = df.groupby(cluster_id).agg(
+        ms_name=("ms_name", ":: ".join),
+        ms=("ms", ":: ".join),
+        commodity=("commodity", "first"),
+        top1_deposit_name=("top1_deposit_name", "first"),
+        lat=("lat", "first"),
+        lon=("lon", "first"),
+    )
+
+    # Prefix the combined values of points that were aggregated together
+    multiple = np.bincount(cluster_id) > 1
+    for column in ["ms_name", "ms"]:
+        aggregated_df.loc[multiple, column] = (
+            ":: " + aggregated_df.loc[multiple, column]
         )
 
-    return pd.DataFrame(aggregated_data)
+    aggregated_df.insert(0, "total_grade", weighted_grade)
+    aggregated_df.insert(1, "total_tonnage", total_tonnage)
+
+    return aggregated_df.reset_index(drop=True)
 
 
 def get_gt_model(gt, proximity_value=0):
@@ -118,105 +90,99 @@ def get_gt_model(gt, proximity_value=0):
     if not gt:
         return None
 
-    # Sorting the deposit types based on group count, avg (total_contained_metal/total_tonnage)
-    gt.df["avg_metal_per_tonnage"] = (
-        gt.df["total_contained_metal"] / gt.df["total_tonnage"]
-    )
-
-    grouped = (
-        gt.df.groupby("top1_deposit_name")
-        .agg({"top1_deposit_name": "count", "avg_metal_per_tonnage": "mean"})
-        .rename(columns={"top1_deposit_name": "count"})
+    # gt.df is shared by every request on the same cached data, so it is only
+    # read here. The deposit type stats and order come from GradeTonnage.init()
+    grouped = gt.grouped
+    unique_labels = gt.df["top1_deposit_name"].cat.categories
+
+    # Define color for each unique category, indexed by its position in unique_labels
+    colors = np.linspace(0, 1, len(unique_labels), dtype=np.float32)
+
+    # Lookup of commodity names for the hover text
+    commodity_names = {
+        key: value["name"] for key, value in gt.data_cache["commodities"].items()
+    }
+
+    hover_template = (
+        "<b>MS Name:</b> %{text}<br>"
+        + "<b>Commodity:</b> %{customdata[0]}<br>"
+        + "<b>Grade:</b> %{y} (%)<br>"
+        + "<b>Tonnage:</b> %{x} (Mt)<br>"
+        + "<extra></extra>"
     )
-
-    # Sort first by count (number of records) and then by avg_metal_per_tonnage, both in descending order
-    unique_labels = grouped.sort_values(
-        by=["count", "avg_metal_per_tonnage"], ascending=[False, False]
-    ).index.tolist()
-
-    # Ensure "Unknown" is at the bottom
-    if "Unknown" in unique_labels:
-        unique_labels.remove("Unknown")
-        unique_labels.append("Unknown")
-
-    # Define color for each unique category in 'dtnorm_labels'
-    colors = np.linspace(0, 1, len(unique_labels))
-    color_map = {label: color for label, color in zip(unique_labels, colors)}
+    base_marker = dict(size=10, symbol="circle")
 
     gt_model = go.Figure()
 
     gt.aggregated_df = []
 
-    for d_type in unique_labels:
-        df_filtered = gt.df[gt.df["top1_deposit_name"] == d_type]
+    # Split gt.df by deposit type in a single pass
+    groups = dict(list(gt.df.groupby("top1_deposit_name", sort=False, observed=True)))
+
+    for idx, d_type in enumerate(unique_labels):
+        df_filtered = groups[d_type]
 
         aggregated_df = df_filtered
         if proximity_value != 0:
             if d_type == "Unknown":
                 continue
+            pair_i, pair_j, pair_d = compute_pairwise_distances(df_filtered)
             aggregated_df = greedy_weighted_avg_aggregation(
-                df_filtered, gt.distance_caches, proximity_value
+                df_filtered, pair_i, pair_j, pair_d, proximity_value
             )
         gt.aggregated_df.append(aggregated_df)
 
-        hover_template = (
-            "<b>MS Name:</b> %{text}<br>"
-            + "<b>Commodity:</b> %{customdata[0]}<br>"
-            + "<b>Grade:</b> %{y} (%)<br>"
-            + "<b>Tonnage:</b> %{x} (Mt)<br>"
-            + "<extra></extra>"
-        )
-
         # Get the count of deposits for this type
         deposit_count = grouped.loc[d_type, "count"]
 
         gt_model.add_trace(
-            go.Scatter(
-                x=aggregated_df["total_tonnage"],
-                y=aggregated_df["total_grade"],
+            go.Scattergl(
+                x=aggregated_df["total_tonnage"].to_numpy(),
+                y=aggregated_df["total_grade"].to_numpy(),
                 mode="markers",
-                text=aggregated_df["ms_name"].apply(
-                    lambda x: x.replace("::", "<br>")
-                ),  # Use truncated names for the labels on the plot
+                text=aggregated_df["ms_name"]
+                .str.replace("::", "<br>", regex=False)
+                .to_numpy(),  # Use truncated names for the labels on the plot
                 hovertemplate=hover_template,  # Use full names for the hover text
-                customdata=pd.DataFrame(
-                    {
-                        "commodity": aggregated_df["commodity"].apply(
-                            lambda x: gt.data_cache["commodities"][x]["name"]
-                        )
-                    }
-                ),
+                customdata=aggregated_df["commodity"]
+                .map(commodity_names)
+                .to_numpy()[:, None],
                 name=f"{d_type} ({deposit_count})",  # Add the count of deposits to the legend name
-                marker=dict(color=color_map[d_type], size=10, symbol="circle"),
+                meta=dict(base_name=d_type),  # Deposit type without the count
+                marker={**base_marker, "color": colors[idx]},
                 textposition="top center",
-                visible=True,
+                visible=(
+                    True
+                    if not gt.visible_traces or d_type in gt.visible_traces
+                    else "legendonly"
+                ),
             )
         )
 
-    y_min = gt.df["total_grade"].min()
-    y_max = gt.df["total_grade"].max()
-    x_min = gt.df["total_tonnage"].min()
-    x_max = gt.df["total_tonnage"].max()
-
-    # Add slant lines representing constant metal content
-    metal_contents = np.logspace(-9, 10, num=20)
-    for metal_content in metal_contents:
-        # Tonnage values range for plotting the line
-        tonnage_range = np.logspace(-8, 8, 100)
-        grade_values = metal_content / tonnage_range  # Grade = Metal Content / Tonnage
-        hover_text = f"<span style='color: white;'><b>Contained Metal:</b> {metal_content / 100} Mt</span>"
-
-        gt_model.add_trace(
-            go.Scatter(
-                y=tonnage_range,
-                x=grade_values,
-                mode="lines",
-                line=dict(color="grey", dash="dash"),
-                showlegend=False,
-                text=hover_text,
-                hoverinfo="text",
-            )
+    (y_min, x_min), (y_max, x_max) = gt.extrema
+
+    # Add slant lines representing constant metal content, drawn as a single trace
+    # with the lines separated by NaN gaps
+    metal_exponents = np.arange(-9, 11)
+    metal_contents = 10.0**metal_exponents
+    # Tonnage values range for plotting the line
+    tonnage_range = np.append(np.logspace(-8, 8, 100), np.nan)
+    # Grade = Metal Content / Tonnage
+    grade_values = metal_contents[:, None] / tonnage_range
+
+    gt_model.add_trace(
+        go.Scattergl(
+            y=np.tile(tonnage_range, len(metal_contents)),
+            x=grade_values.ravel(),
+            mode="lines",
+            line=dict(color="grey", dash="dash"),
+            showlegend=False,
+            # Only the power of ten of the contained metal (in Mt) is sent for each
+            # point, the hover label is formatted by the template on the client
+            customdata=np.repeat(metal_exponents - 2, len(tonnage_range)),
+            hovertemplate="<span style='color: white;'><b>Contained Metal:</b> 10<sup>%{customdata}</sup> Mt</span><extra></extra>",
         )
+    )
 
     # Logarithmic scale and layout adjustments
     gt_model.update_layout(
@@ -240,13 +206,4 @@ def get_gt_model(gt, proximity_value=0):
         dragmode="pan",
     )
 
-    if len(gt.visible_traces) > 0:
-        for trace in gt_model["data"]:
-            if trace.hovertemplate:
-                trace_name = " ".join(trace["name"].split()[:-1])
-                if trace_name in gt.visible_traces:
-                    trace.visible = True
-                else:
-                    trace.visible = "legendonly"
-
     return gt, gt_model
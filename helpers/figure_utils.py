@@ -0,0 +1,17 @@
+def trace_base_name(trace):
+    """Deposit type of a grade-tonnage trace, without the count in its legend name"""
+    base_name = (trace.get("meta") or {}).get("base_name")
+    if base_name is not None:
+        return base_name
+    return trace["name"].rsplit(" ", 1)[0]
+
+
+def visible_trace_names(figure):
+    """Base names of the deposit type traces currently visible in a figure dict"""
+    return {
+        trace_base_name(trace)
+        for trace in figure["data"]
+        if trace.get("name")
+        and "hovertemplate" in trace
+        and trace.get("visible", True) is True
+    }
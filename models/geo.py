@@ -18,23 +18,36 @@ class GeoMineral:
 
     def init(self):
         """Initialize and load data from query path using the function reference"""
-        self.load_data_cache()
-
-        self.df = pd.DataFrame(
-            self.clean_and_fix(
-                dataservice_utils.fetch_api_data(
-                    "/dedup-mineral-sites",
-                    params={"commodity": self.commodity},
-                    ssl_flag=False,
-                )
-            )
+        # The mineral sites are fetched concurrently with the data cache
+        (raw_data,) = self.load_data_cache(
+            ("/dedup-mineral-sites", {"commodity": self.commodity})
         )
 
-    def load_data_cache(self):
+        self.df = self.clean_and_fix(raw_data)
+
+        # Downcast numeric columns
+        for column in [
+            "total_grade",
+            "total_tonnage",
+            "total_contained_metal",
+            "lat",
+            "lon",
+            "top1_deposit_confidence",
+        ]:
+            if column in self.df:
+                self.df[column] = pd.to_numeric(
+                    self.df[column], errors="coerce", downcast="float"
+                )
+
+    def load_data_cache(self, *requests):
+        """Loads the data cache, fetching any extra (path, params) requests in the
+        same batch and returning their results"""
         data_list = sorted(self.data_cache.keys())
 
         data_results = asyncio.run(
-            dataservice_utils.fetch_all([("/" + url, None) for url in data_list])
+            dataservice_utils.fetch_all(
+                [("/" + url, None) for url in data_list] + list(requests)
+            )
         )
 
         for i in range(len(data_list)):
@@ -42,89 +55,94 @@ class GeoMineral:
                 q_key = data["uri"].split("/")[-1]
                 self.data_cache[data_list[i]][q_key] = data
 
+        return data_results[len(data_list) :]
+
     def clean_and_fix(self, raw_data):
-        results = []
-        for data in raw_data:
-
-            if len(data["deposit_types"]) == 0:
-                continue
-
-            combined_data = {}
-            combined_data["ms"] = "/".join(["/derived", data["id"]])
-            combined_data["ms_name"] = data["name"]
-            combined_data["ms_type"] = data["type"]
-            combined_data["ms_rank"] = data["rank"]
-
-            # Location details
-            if (
-                "location" in data
-                and "country" in data["location"]
-                and data["location"]["country"]
-                and data["location"]["country"][0] in self.data_cache["countries"]
-            ):
-                combined_data["country"] = self.data_cache["countries"][
-                    data["location"]["country"][0]
-                ]["name"]
-            else:
-                combined_data["country"] = None
-
-            if (
-                "location" in data
-                and "state_or_province" in data["location"]
-                and data["location"]["state_or_province"]
-                and data["location"]["state_or_province"][0]
-                in self.data_cache["states-or-provinces"]
-            ):
-                combined_data["state_or_province"] = self.data_cache[
-                    "states-or-provinces"
-                ][data["location"]["state_or_province"][0]]["name"]
-            else:
-                combined_data["state_or_province"] = None
-
-            if "location" in data:
-                combined_data["lat"] = data["location"].get("lat", None)
-                combined_data["lon"] = data["location"].get("lon", None)
-
-            # Deposit Type details
-            highest_confidence_deposit = max(
-                data["deposit_types"], key=lambda x: x["confidence"]
+        df = pd.json_normalize(raw_data)
+        if "deposit_types" in df:
+            df = df[df["deposit_types"].str.len() > 0]
+        if df.empty:
+            return pd.DataFrame()
+
+        def column(name):
+            # Nested fields missing from every record are absent after normalizing
+            return (
+                df[name]
+                if name in df
+                else pd.Series(None, index=df.index, dtype=object)
             )
 
-            deposit_details = self.data_cache["deposit-types"].get(
-                highest_confidence_deposit["id"], None
-            )
+        # Location details
+        country_names = {
+            key: value["name"] for key, value in self.data_cache["countries"].items()
+        }
+        state_names = {
+            key: value["name"]
+            for key, value in self.data_cache["states-or-provinces"].items()
+        }
 
-            if not deposit_details:
-                continue
-            combined_data["top1_deposit_name"] = deposit_details["name"]
-            combined_data["top1_deposit_group"] = deposit_details["group"]
-            combined_data["top1_deposit_environment"] = deposit_details["environment"]
-            combined_data["top1_deposit_confidence"] = highest_confidence_deposit[
-                "confidence"
-            ]
-            combined_data["top1_deposit_source"] = highest_confidence_deposit["source"]
-
-            # Commodity details
-            combined_data["commodity"] = data["grade_tonnage"][0]["commodity"]
-
-            # GT details
-            if "total_grade" in data["grade_tonnage"][0]:
-                combined_data["total_grade"] = data["grade_tonnage"][0]["total_grade"]
-                combined_data["total_tonnage"] = data["grade_tonnage"][0][
-                    "total_tonnage"
-                ]
-                combined_data["total_contained_metal"] = data["grade_tonnage"][0][
+        # Deposit Type details, flattened to one row per (site, deposit type) so
+        # the highest confidence deposit of every site is found in one groupby
+        deposit_types = df["deposit_types"].explode()
+        deposit_types = pd.json_normalize(deposit_types.tolist()).set_index(
+            deposit_types.index
+        )
+        # Null confidences rank last, so a site whose confidences are all null
+        # still keeps its first deposit type instead of a NaN position
+        top_position = (
+            pd.to_numeric(deposit_types["confidence"], errors="coerce")
+            .fillna(float("-inf"))
+            .reset_index(drop=True)
+            .groupby(deposit_types.index.to_numpy(), sort=False)
+            .idxmax()
+        )
+        highest_confidence_deposit = deposit_types.iloc[top_position.to_numpy()]
+        deposit_id = highest_confidence_deposit["id"]
+        deposit_details = pd.DataFrame.from_dict(
+            self.data_cache["deposit-types"],
+            orient="index",
+            columns=["name", "group", "environment"],
+        ).reindex(deposit_id)
+        deposit_details.index = df.index
+
+        # GT details
+        grade_tonnage = df["grade_tonnage"].str[0]
+
+        results = pd.DataFrame(
+            {
+                "ms": "/derived/" + df["id"],
+                "ms_name": df["name"],
+                "ms_type": df["type"],
+                "ms_rank": df["rank"],
+                "country": column("location.country").str[0].map(country_names),
+                "state_or_province": column("location.state_or_province")
+                .str[0]
+                .map(state_names),
+                "lat": column("location.lat"),
+                "lon": column("location.lon"),
+                "top1_deposit_name": deposit_details["name"],
+                "top1_deposit_group": deposit_details["group"],
+                "top1_deposit_environment": deposit_details["environment"],
+                "top1_deposit_confidence": highest_confidence_deposit["confidence"],
+                "top1_deposit_source": highest_confidence_deposit["source"],
+                "commodity": grade_tonnage.str.get("commodity"),
+                "total_grade": grade_tonnage.str.get("total_grade").astype(float),
+                "total_tonnage": grade_tonnage.str.get("total_tonnage").astype(float),
+                "total_contained_metal": grade_tonnage.str.get(
                     "total_contained_metal"
-                ]
+                ).astype(float),
+            }
+        )
 
-            # Setting Unkown Deposit Types
-            if not combined_data.get("total_tonnage") or not combined_data.get(
-                "total_grade"
-            ):
-                combined_data["top1_deposit_name"] = "Unknown"
+        # Setting Unkown Deposit Types
+        missing_gt = ~(
+            results["total_tonnage"].fillna(0).astype(bool)
+            & results["total_grade"].fillna(0).astype(bool)
+        )
+        results.loc[missing_gt, "top1_deposit_name"] = "Unknown"
 
-            results.append(combined_data)
-        return results
+        # Dropping sites whose deposit type is not in the cache
+        return results[deposit_details["name"].notna()].reset_index(drop=True)
 
     def update_commodity(self, selected_commodity):
         """sets new commodity"""
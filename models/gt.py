@@ -1,8 +1,8 @@
 import pandas as pd
 from helpers import dataservice_utils
-from math import radians, sin, cos, sqrt, atan2
-from functools import lru_cache
-import numpy as np
+from collections import OrderedDict
+from functools import wraps
+import threading
 from helpers.exceptions import EmptyDedupDataFrame, EmtpyGTDataFrame
 from datetime import datetime, timedelta
 import asyncio
@@ -12,46 +12,47 @@ from constants import API_ENDPOINT
 # Define a constant date range (e.g., 30 days)
 CACHE_DURATION_DAYS = 3
 
-# Cache storage for the last-used timestamps
-cache_access_times = {}
 
-
-# Decorator to create a cache with a time-based expiration
+# Decorator to create an LRU cache whose entries expire CACHE_DURATION_DAYS after
+# they were computed, however often they are used
 def lru_cache_with_date_range(maxsize=128):
     def decorator(func):
-        # LRU Cache
-        @lru_cache(maxsize=maxsize)
-        def wrapper(*args, **kwargs):
-            return func(*args, **kwargs)
+        # Cached results along with their load time, least recently used first
+        cache = OrderedDict()
+        lock = threading.Lock()
 
-        # Function to check and clear outdated cache entries
-        def clear_expired_cache():
+        @wraps(func)
+        def cached_func(*args, **kwargs):
+            key = args + tuple(sorted(kwargs.items()))
             current_time = datetime.now()
-            for key in list(cache_access_times.keys()):
-                if current_time - cache_access_times[key] > timedelta(
-                    days=CACHE_DURATION_DAYS
-                ):
-                    wrapper.cache_clear()  # Clear the entire cache if one entry is too old
-                    break  # You can modify this to clear only the expired keys if needed
 
-        # Wrap the original function to track access times
-        def cached_func(*args, **kwargs):
-            clear_expired_cache()  # Check and clear expired cache before any function call
-            result = wrapper(*args, **kwargs)
-            cache_access_times[args] = (
-                datetime.now()
-            )  # Track when the cache was last used
+            with lock:
+                entry = cache.get(key)
+                if entry is not None:
+                    loaded_at, result = entry
+                    if current_time - loaded_at <= timedelta(days=CACHE_DURATION_DAYS):
+                        cache.move_to_end(key)
+                        return result
+                    # Only the expired entry is dropped
+                    del cache[key]
+
+            # Loading happens outside the lock so other keys are not blocked
+            result = func(*args, **kwargs)
+
+            with lock:
+                cache[key] = (current_time, result)
+                cache.move_to_end(key)
+                # The timestamp goes away with its evicted entry
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
             return result
 
+        cached_func.cache_clear = cache.clear
         return cached_func
 
     return decorator
 
 
-# Earth radius in kms
-EARTH_RADIUS = 6371.0  # in kms
-
-
 class GradeTonnage:
     """A class for holding the grade tonnage model plot"""
 
@@ -59,10 +60,11 @@ class GradeTonnage:
         self.commodities = [commodity.lower() for commodity in commodities]
         self.deposit_types = []
         self.country = []
-        self.distance_caches = {}
         self.proximity_value = proximity_value
-        self.visible_traces = []
+        self.visible_traces = set()
         self.aggregated_df = []
+        self.grouped = None
+        self.extrema = None
         self.data_cache = {
             "countries": {},
             "deposit-types": {},
@@ -111,11 +113,53 @@ class GradeTonnage:
             raise EmptyDedupDataFrame("No Data Available")
 
         self.df = self.clean_df(self.df)
+
+        # The commodity is repeated on every row and grouped / mapped on every
+        # render. total_contained_metal only feeds avg_metal_per_tonnage, the
+        # grade, tonnage and coordinates stay float64 as they end up in the CSV
+        self.df = self.df.astype({"commodity": "category"})
+        self.df["total_contained_metal"] = pd.to_numeric(
+            self.df["total_contained_metal"], errors="coerce", downcast="float"
+        )
+        self.compute_deposit_type_stats()
         self.deposit_types = self.df["top1_deposit_name"].drop_duplicates().to_list()
         self.country = self.df["country"].to_list()
 
-        if self.proximity_value != 0:
-            self.distance_caches = self.compute_all_distances(tuple(self.commodities))
+    def compute_deposit_type_stats(self):
+        """
+        Compute the per deposit type stats, plotting order and axis extrema once per
+        loaded dataset, so that building the plot only reads self.df
+        """
+        # Sorting the deposit types based on group count, avg (total_contained_metal/total_tonnage)
+        self.df = self.df.assign(
+            avg_metal_per_tonnage=self.df["total_contained_metal"]
+            / self.df["total_tonnage"]
+        ).astype({"top1_deposit_name": "category"})
+
+        self.grouped = (
+            self.df.groupby("top1_deposit_name", observed=True)
+            .agg({"top1_deposit_name": "count", "avg_metal_per_tonnage": "mean"})
+            .rename(columns={"top1_deposit_name": "count"})
+        )
+
+        # Sort first by count (number of records) and then by avg_metal_per_tonnage, both in descending order
+        sorted_labels = self.grouped.sort_values(
+            by=["count", "avg_metal_per_tonnage"], ascending=[False, False]
+        ).index
+
+        # Encode the plotting order in the categorical, with "Unknown" at the bottom
+        ordered_labels = [label for label in sorted_labels if label != "Unknown"]
+        if "Unknown" in sorted_labels:
+            ordered_labels.append("Unknown")
+
+        self.df["top1_deposit_name"] = self.df["top1_deposit_name"].cat.set_categories(
+            ordered_labels, ordered=True
+        )
+
+        # Axis extrema as [[min grade, min tonnage], [max grade, max tonnage]]
+        self.extrema = (
+            self.df[["total_grade", "total_tonnage"]].agg(["min", "max"]).to_numpy()
+        )
 
     def load_data_cache(self):
         data_list = sorted(self.data_cache.keys())
@@ -134,8 +178,11 @@ class GradeTonnage:
         self.commodities = [
             selected_commodity.lower() for selected_commodity in selected_commodities
         ]
-        self.visible_traces = []
+        self.visible_traces = set()
         self.aggregated_df = []
+        # The deposit type stats are rebuilt by init() for the new commodities
+        self.grouped = None
+        self.extrema = None
 
     def update_proximity(self, proximity_value):
         """sets new proximity"""
@@ -257,42 +304,3 @@ class GradeTonnage:
                 )
 
         return df
-
-    # Haversine distance function to calculate distance in miles
-    def haversine(self, lat1, lon1, lat2, lon2):
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-        return EARTH_RADIUS * c  # Returns distance in miles
-
-    # Caching approach: Precompute all pairwise distances and store them
-    @lru_cache_with_date_range(maxsize=10)
-    def compute_all_distances(self, commodities):
-        distances = {}
-        indices = self.df.index
-
-        for i in indices:
-            for j in indices:
-                if i < j:
-                    distance = self.haversine(
-                        self.df.loc[i, "lat"],
-                        self.df.loc[i, "lon"],
-                        self.df.loc[j, "lat"],
-                        self.df.loc[j, "lon"],
-                    )
-                    distances[(i, j)] = distance
-                    distances[(j, i)] = distance
-
-        return distances
-
-    def extract_lat_lon(self, wkt_point):
-        if pd.isnull(wkt_point):
-            return pd.Series([np.nan, np.nan])  # Return NaN if the value is null
-        # Remove 'POINT(' and ')' and split by space
-        wkt_point = wkt_point.replace("POINT (", "").replace(")", "")
-        lon, lat = map(float, wkt_point.split())
-        return pd.Series([lat, lon])
@@ -3,16 +3,39 @@ from dash import html, callback, clientside_callback, dcc
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 import pandas as pd
-import json
+import copy
+from functools import lru_cache
 
 from helpers import kpis
+from helpers.figure_utils import visible_trace_names
 from components import get_gt_model
 from models import GradeTonnage
+from models.gt import lru_cache_with_date_range
 from helpers.exceptions import MinModException
 from constants import ree_minerals, heavy_ree_minerals, light_ree_minerals, pge_minerals
 
 dash.register_page(__name__, path="/gtmodel")
 
+# Custom dropdown entries expanding to a group of commodities
+_COMMODITY_GROUPS = {
+    "REE": frozenset(ree_minerals),
+    "HEAVY-REE": frozenset(heavy_ree_minerals),
+    "LIGHT-REE": frozenset(light_ree_minerals),
+    "PGE": frozenset(pge_minerals),
+}
+
+# Columns of the aggregated data kept in the store for the CSV download
+_EXPORT_COLUMNS = [
+    "ms",
+    "ms_name",
+    "commodity",
+    "top1_deposit_name",
+    "lat",
+    "lon",
+    "total_tonnage",
+    "total_grade",
+]
+
 layout = html.Div(
     style={
         "display": "flex",
@@ -78,13 +101,37 @@ layout = html.Div(
                             dbc.Spinner(
                                 html.Div(
                                     [
-                                        dcc.Graph(
-                                            id="clickable-plot",
-                                            figure={},
+                                        # Error messages
+                                        html.Div(id="render-plot"),
+                                        # The graph is created once and only its
+                                        # figure is updated by the callbacks
+                                        dbc.Card(
+                                            dbc.CardBody(
+                                                [
+                                                    dcc.Graph(
+                                                        id="clickable-plot",
+                                                        figure={},
+                                                        config={
+                                                            "displayModeBar": True,
+                                                            "displaylogo": False,
+                                                            "responsive": True,
+                                                            "showTips": True,
+                                                            "scrollZoom": True,
+                                                            "modeBarButtonsToRemove": [
+                                                                "autoScale2d",
+                                                                "lasso2d",
+                                                                "select2d",
+                                                                "zoomIn2d",
+                                                                "zoomOut2d",
+                                                            ],
+                                                        },
+                                                    )
+                                                ]
+                                            ),
+                                            id="plot-card",
                                             style={"display": "none"},
-                                        )
-                                    ],
-                                    id="render-plot",
+                                        ),
+                                    ]
                                 ),
                                 size="lg",
                                 spinner_style={"width": "4rem", "height": "4rem"},
@@ -169,7 +216,7 @@ layout = html.Div(
             },
         ),
         dcc.Store(id="gt-agg-data"),
-        dcc.Store(id="gt-df-data"),
+        dcc.Store(id="gt-ms-map"),
         dcc.Store(id="select-commodity-data"),
         html.Div(id="url", style={"display": "none"}),
         html.Div(id="url-div", style={"display": "none"}),
@@ -177,6 +224,51 @@ layout = html.Div(
 )
 
 
+def _df_to_store(df):
+    """
+    Convert a DataFrame into a plain "split" dict that dcc.Store serializes once,
+    instead of nesting pandas JSON strings inside another JSON document.
+    """
+    return df.to_dict(orient="split")
+
+
+def _store_to_df(data):
+    """Rebuild a DataFrame stored with _df_to_store."""
+    return pd.DataFrame(**data)
+
+
+def _ms_map(df):
+    """
+    Map every ms_name to its ms url (first one wins), so a click on the plot
+    is a single lookup instead of rebuilding the whole DataFrame.
+    """
+    df = df.drop_duplicates("ms_name")
+    return dict(zip(df["ms_name"], df["ms"]))
+
+
+@lru_cache(maxsize=1)
+def _commodity_options():
+    """
+    Build the commodity dropdown options once per process.
+    Call _commodity_options.cache_clear() to refetch them.
+    """
+    return [
+        {"label": commodity, "value": commodity} for commodity in kpis.get_commodities()
+    ]
+
+
+@lru_cache_with_date_range(maxsize=32)
+def _build_gt(commodities_key):
+    """
+    Load the grade-tonnage data for a set of commodities, reused across callbacks.
+    The proximity only affects the figure, so it is not part of the key. The data
+    is refetched once the cache expires, CACHE_DURATION_DAYS after it was loaded.
+    """
+    gt = GradeTonnage(list(commodities_key))
+    gt.init()
+    return gt
+
+
 @callback(
     Output("commodity-gt", "options"),
     Input("url-gt", "pathname"),
@@ -185,10 +277,7 @@ def update_commodity_dropdown(pathname):
     """
     Update the commodity dropdown options whenever this page loads or refreshes.
     """
-    options = [
-        {"label": commodity, "value": commodity} for commodity in kpis.get_commodities()
-    ]
-    return options
+    return _commodity_options()
 
 
 @callback(
@@ -207,9 +296,11 @@ def toggle_slider_and_download(figure):
 @callback(
     [
         Output("gt-agg-data", "agg_data"),
-        Output("gt-df-data", "df_data"),
+        Output("gt-ms-map", "data"),
         Output("select-commodity-data", "commodity_data"),
         Output("render-plot", "children"),
+        Output("clickable-plot", "figure"),
+        Output("plot-card", "style"),
         Output("commodity-gt", "value"),
     ],
     [
@@ -243,19 +334,16 @@ def update_output(
     triggered_id = ctx.triggered[0]["prop_id"].split(".")[0]
 
     if not selected_commodities:
-        # If no commodity is selected, reset the figure
+        # If no commodity is selected, reset the figure. The stores are left
+        # as they are since nothing reads them without a figure
         return (
+            dash.no_update,
+            dash.no_update,
             None,
-            None,
-            None,
-            [
-                dcc.Graph(
-                    id="clickable-plot",
-                    figure={},
-                    style={"display": "none"},
-                ),
-            ],
             [],
+            {"data": [], "layout": {}},
+            {"display": "none"},
+            dash.no_update,
         )
 
     # Default proximity value = 0 unless user clicked Aggregate
@@ -264,60 +352,48 @@ def update_output(
         proximity_value = user_proximity_value or 0
 
     # Expand custom REE groupings
-    if "REE" in selected_commodities:
-        selected_commodities.remove("REE")
-        selected_commodities = list(set(selected_commodities + ree_minerals))
-
-    if "HEAVY-REE" in selected_commodities:
-        selected_commodities.remove("HEAVY-REE")
-        selected_commodities = list(set(selected_commodities + heavy_ree_minerals))
-
-    if "LIGHT-REE" in selected_commodities:
-        selected_commodities.remove("LIGHT-REE")
-        selected_commodities = list(set(selected_commodities + light_ree_minerals))
-
-    if "PGE" in selected_commodities:
-        selected_commodities.remove("PGE")
-        selected_commodities = list(set(selected_commodities + pge_minerals))
+    selected = set(selected_commodities)
+    commodities = selected - _COMMODITY_GROUPS.keys()
+    for group in selected & _COMMODITY_GROUPS.keys():
+        commodities |= _COMMODITY_GROUPS[group]
+    selected_commodities = sorted(commodities)
 
     try:
-        gt = GradeTonnage(selected_commodities, proximity_value)
-        gt.init()
+        # Shallow copy so per-request state does not leak into the cached instance
+        gt = copy.copy(_build_gt(tuple(selected_commodities)))
+        gt.update_proximity(proximity_value)
 
         # Preserve visibility from the existing figure if the user just clicked Aggregate
         if triggered_id == "aggregate-btn" and figure and "data" in figure:
-            visible_traces = [
-                " ".join(trace["name"].split()[:-1])
-                for trace in figure["data"]
-                if "hovertemplate" in trace and trace.get("visible", True) is True
-            ]
-            gt.visible_traces = visible_traces
+            gt.visible_traces = visible_trace_names(figure)
 
     except MinModException as e:
         # Handle custom exception
         return (
-            None,
-            None,
+            dash.no_update,
+            dash.no_update,
             selected_commodities,
             [
                 dbc.Alert(str(e), color="danger"),
-                dcc.Graph(id="clickable-plot", figure={}, style={"display": "none"}),
             ],
+            {"data": [], "layout": {}},
+            {"display": "none"},
             selected_commodities,
         )
     except Exception:
         # Handle generic error
         return (
-            None,
-            None,
+            dash.no_update,
+            dash.no_update,
             selected_commodities,
             [
                 dbc.Alert(
                     "No results found or there was an error with the query.",
                     color="danger",
                 ),
-                dcc.Graph(id="clickable-plot", figure={}, style={"display": "none"}),
             ],
+            {"data": [], "layout": {}},
+            {"display": "none"},
             selected_commodities,
         )
 
@@ -325,37 +401,12 @@ def update_output(
     gt, gt_model_plot = get_gt_model(gt, proximity_value)
 
     return (
-        json.dumps(
-            [df.to_json(date_format="iso", orient="split") for df in gt.aggregated_df]
-        ),
-        gt.df.to_json(date_format="iso", orient="split"),
+        [_df_to_store(df[_EXPORT_COLUMNS]) for df in gt.aggregated_df],
+        _ms_map(gt.df),
         selected_commodities,
-        [
-            dbc.Card(
-                dbc.CardBody(
-                    [
-                        dcc.Graph(
-                            id="clickable-plot",
-                            figure=gt_model_plot,
-                            config={
-                                "displayModeBar": True,
-                                "displaylogo": False,
-                                "responsive": True,
-                                "showTips": True,
-                                "scrollZoom": True,
-                                "modeBarButtonsToRemove": [
-                                    "autoScale2d",
-                                    "lasso2d",
-                                    "select2d",
-                                    "zoomIn2d",
-                                    "zoomOut2d",
-                                ],
-                            },
-                        )
-                    ]
-                )
-            )
-        ],
+        [],
+        gt_model_plot,
+        {},
         selected_commodities,
     )
 
@@ -364,20 +415,21 @@ def update_output(
     Output("url", "children"),
     Output("clickable-plot", "clickData"),
     Input("clickable-plot", "clickData"),
-    State("gt-df-data", "df_data"),
+    State("gt-ms-map", "data"),
     prevent_initial_call=True,
 )
-def open_url(clickData, df_data):
+def open_url(clickData, ms_map):
     """
     A callback to open the clicked ms url on a new tab.
     Resets clickData so repeated clicks on the same point still trigger.
     """
-    if not df_data:
+    if not ms_map:
         raise dash.exceptions.PreventUpdate
-    df_data = pd.read_json(df_data, orient="split")
     if clickData:
-        filtered_df = df_data[df_data["ms_name"] == clickData["points"][0]["text"]]
-        return filtered_df["ms"].tolist()[0], None
+        try:
+            return ms_map[clickData["points"][0]["text"]], None
+        except KeyError:
+            raise dash.exceptions.PreventUpdate
     return None, None
 
 
@@ -395,6 +447,24 @@ clientside_callback(
 )
 
 
+def _export_chunk(df, visible_traces):
+    """
+    Select the rows of one stored aggregated DataFrame for the visible traces.
+    """
+    df = df[df["top1_deposit_name"].isin(visible_traces)]
+
+    # Clean up text of aggregated points
+    return df.assign(
+        **{
+            column: df[column].where(
+                ~df[column].str.contains("::", regex=False),
+                df[column].str.slice(2).str.replace("::", ",", regex=False),
+            )
+            for column in ["ms_name", "ms"]
+        }
+    )
+
+
 @callback(
     Output("download-csv", "data"),
     Input("download-btn", "n_clicks"),
@@ -414,21 +484,7 @@ def download_csv(n_clicks, agg_data, figure):
         raise dash.exceptions.PreventUpdate
 
     try:
-        aggregated_df = [
-            pd.read_json(dt, orient="split") for dt in json.loads(agg_data)
-        ]
-        df = pd.concat(aggregated_df, ignore_index=True)[
-            [
-                "ms",
-                "ms_name",
-                "commodity",
-                "top1_deposit_name",
-                "lat",
-                "lon",
-                "total_tonnage",
-                "total_grade",
-            ]
-        ].copy()
+        aggregated_df = [_store_to_df(dt) for dt in agg_data]
 
         column_names = [
             "Mineral Site URL",
@@ -441,29 +497,25 @@ def download_csv(n_clicks, agg_data, figure):
             "Total Grade(Percent)",
         ]
 
-        # Only keep data corresponding to visible traces
-        visible_traces = [
-            " ".join(trace["name"].split()[:-1])
-            for trace in figure["data"]
-            if "hovertemplate" in trace and trace.get("visible", True) is True
-        ]
-        df = df[df["top1_deposit_name"].isin(visible_traces)]
-
-        # Clean up text
-        df["ms_name"] = df["ms_name"].apply(
-            lambda x: x[2:].replace("::", ",") if "::" in x else x
-        )
-        df["ms"] = df["ms"].apply(
-            lambda x: x[2:].replace("::", ",") if "::" in x else x
-        )
+        # Only keep data corresponding to visible traces, filtering each frame once
+        visible_traces = visible_trace_names(figure)
+        chunks = [_export_chunk(df, visible_traces) for df in aggregated_df]
+        chunks = [chunk for chunk in chunks if not chunk.empty]
 
-        df.columns = column_names
-
-        if df.empty:
+        if not chunks:
             print("No data available to download.")
             raise dash.exceptions.PreventUpdate
 
-        return dcc.send_data_frame(df.to_csv, "gt_data.csv")
+        def write_csv(buffer):
+            # Write the deposit types one after another into the buffer that
+            # send_string collects, with the header only once, instead of
+            # concatenating them into a single DataFrame first
+            for index, chunk in enumerate(chunks):
+                chunk.to_csv(
+                    buffer, header=column_names if index == 0 else False, index=False
+                )
+
+        return dcc.send_string(write_csv, "gt_data.csv")
     except Exception as e:
         print(f"Error generating CSV: {e}")
         raise dash.exceptions.PreventUpdate
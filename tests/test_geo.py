@@ -0,0 +1,65 @@
+from models.geo import GeoMineral
+
+
+def make_site(site_id, deposit_types):
+    return {
+        "id": site_id,
+        "name": f"Site {site_id}",
+        "type": "Occurrence",
+        "rank": "A",
+        "location": {"lat": 10.0, "lon": 20.0},
+        "deposit_types": deposit_types,
+        "grade_tonnage": [
+            {
+                "commodity": "Q100",
+                "total_grade": 1.5,
+                "total_tonnage": 2.0,
+                "total_contained_metal": 3.0,
+            }
+        ],
+    }
+
+
+def make_geo():
+    geo = GeoMineral("nickel")
+    geo.data_cache["deposit-types"] = {
+        "Q1": {"name": "Deposit One", "group": "Group", "environment": "Env"},
+        "Q2": {"name": "Deposit Two", "group": "Group", "environment": "Env"},
+    }
+    return geo
+
+
+def test_clean_and_fix_picks_highest_confidence_deposit():
+    df = make_geo().clean_and_fix(
+        [
+            make_site(
+                "site1",
+                [
+                    {"id": "Q1", "confidence": 0.2, "source": "a"},
+                    {"id": "Q2", "confidence": 0.8, "source": "b"},
+                ],
+            )
+        ]
+    )
+
+    assert df["top1_deposit_name"].tolist() == ["Deposit Two"]
+    assert df["top1_deposit_source"].tolist() == ["b"]
+
+
+def test_clean_and_fix_keeps_sites_with_null_confidences():
+    df = make_geo().clean_and_fix(
+        [
+            make_site("site1", [{"id": "Q1", "confidence": None, "source": "a"}]),
+            make_site(
+                "site2",
+                [
+                    {"id": "Q2", "confidence": None, "source": "b"},
+                    {"id": "Q1", "confidence": 0.5, "source": "c"},
+                ],
+            ),
+        ]
+    )
+
+    assert df["ms"].tolist() == ["/derived/site1", "/derived/site2"]
+    assert df["top1_deposit_name"].tolist() == ["Deposit One", "Deposit One"]
+    assert df["top1_deposit_source"].tolist() == ["a", "c"]
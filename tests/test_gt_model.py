@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from components.cards.gt_model import (
+    cluster_edges,
+    compute_pairwise_distances,
+    greedy_weighted_avg_aggregation,
+)
+
+
+def make_sites(coords, grades=None, tonnages=None):
+    n = len(coords)
+    return pd.DataFrame(
+        {
+            "ms": [f"/derived/site{i}" for i in range(n)],
+            "ms_name": [f"Site {i}" for i in range(n)],
+            "commodity": ["Q100"] * n,
+            "top1_deposit_name": ["Deposit"] * n,
+            "lat": [lat for lat, _ in coords],
+            "lon": [lon for _, lon in coords],
+            "total_grade": grades or [1.0] * n,
+            "total_tonnage": tonnages or [1.0] * n,
+        }
+    )
+
+
+def clusters(df, threshold):
+    pair_i, pair_j, pair_d = compute_pairwise_distances(df)
+    return cluster_edges(len(df), pair_i, pair_j, pair_d, threshold).tolist()
+
+
+def test_compute_pairwise_distances():
+    # One degree of latitude is ~111.19 km
+    pair_i, pair_j, pair_d = compute_pairwise_distances(
+        make_sites([(0.0, 0.0), (1.0, 0.0), (3.0, 0.0)])
+    )
+
+    assert pair_i.tolist() == [0, 0, 1]
+    assert pair_j.tolist() == [1, 2, 2]
+    np.testing.assert_allclose(pair_d, [111.19, 333.58, 222.39], atol=0.01)
+
+
+def test_cluster_edges_merges_chains_transitively():
+    # 0-1 and 1-2 are ~89 km apart but 0-2 is ~178 km, site 3 is far away
+    df = make_sites([(0.0, 0.0), (0.8, 0.0), (1.6, 0.0), (10.0, 0.0)])
+
+    assert clusters(df, 100) == [0, 0, 0, 1]
+
+
+def test_cluster_edges_merges_chains_given_in_any_order():
+    # A chain whose edges link the highest positions first still collapses
+    df = make_sites([(0.0, 0.0), (2.4, 0.0), (1.6, 0.0), (0.8, 0.0), (3.2, 0.0)])
+
+    assert clusters(df, 100) == [0, 0, 0, 0, 0]
+
+
+def test_cluster_edges_keeps_singletons():
+    df = make_sites([(0.0, 0.0), (0.5, 0.0), (5.0, 0.0), (10.0, 0.0)])
+
+    assert clusters(df, 100) == [0, 0, 1, 2]
+    assert clusters(df, 1) == [0, 1, 2, 3]
+
+
+def test_cluster_edges_single_site():
+    df = make_sites([(0.0, 0.0)])
+    pair_i, pair_j, pair_d = compute_pairwise_distances(df)
+
+    assert len(pair_d) == 0
+    assert cluster_edges(1, pair_i, pair_j, pair_d, 100).tolist() == [0]
+
+
+def test_cluster_edges_nan_coordinates_stay_alone():
+    df = make_sites([(0.0, 0.0), (np.nan, np.nan), (0.5, 0.0), (0.0, np.nan)])
+
+    assert clusters(df, 100) == [0, 1, 0, 2]
+
+
+def test_greedy_weighted_avg_aggregation():
+    df = make_sites(
+        [(0.0, 0.0), (0.5, 0.0), (10.0, 0.0)],
+        grades=[1.0, 4.0, 2.0],
+        tonnages=[3.0, 1.0, 5.0],
+    )
+    pair_i, pair_j, pair_d = compute_pairwise_distances(df)
+
+    aggregated_df = greedy_weighted_avg_aggregation(df, pair_i, pair_j, pair_d, 100)
+
+    assert aggregated_df["ms_name"].tolist() == [":: Site 0:: Site 1", "Site 2"]
+    assert aggregated_df["ms"].tolist() == [
+        ":: /derived/site0:: /derived/site1",
+        "/derived/site2",
+    ]
+    # Grade is averaged using the tonnage as weights, tonnage is summed
+    np.testing.assert_allclose(aggregated_df["total_grade"], [1.75, 2.0])
+    np.testing.assert_allclose(aggregated_df["total_tonnage"], [4.0, 5.0])
+    assert aggregated_df["lat"].tolist() == [0.0, 10.0]